@@ -25,7 +25,7 @@
 ######################################################################
 
 # General modules
-import string, sys, os, re
+import sys, os, re
 
 # Our testing module
 import svntest
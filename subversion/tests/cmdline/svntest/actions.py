@@ -23,8 +23,8 @@
 #    under the License.
 ######################################################################
 
-import os, shutil, re, sys, errno
-import difflib, pprint, logging
+import os, re, sys, errno
+import difflib, pprint, logging, time, hashlib
 import xml.parsers.expat
 from xml.dom.minidom import parseString
 if sys.version_info[0] >= 3:
@@ -43,6 +43,11 @@ logger = logging.getLogger()
 # (abbreviation)
 Item = svntest.wc.StateItem
 
+# Patterns matching the last lines of 'svn commit' and 'svn import' output,
+# compiled once rather than on every commit.
+_committed_re = re.compile("(Committed|Imported) revision [0-9]+.")
+_transmitting_re = re.compile("Transmitting file data.+")
+
 def _log_tree_state(msg, actual, subtree=""):
   if subtree:
     subtree += os.sep
@@ -64,8 +69,62 @@ def no_relocate_validation():
 def do_relocate_validation():
   os.environ['SVN_I_LOVE_CORRUPTED_WORKING_COPIES_SO_DISABLE_RELOCATE_VALIDATION'] = 'no'
 
+def _greek_tree_dump():
+  """Return a dump stream, as a list of byte strings, whose revision 1
+  adds the greek tree the way 'svn import' by wc_author would."""
+
+  def encoded_len(s):
+    return len(s.encode('utf-8'))
+
+  def props_block(props):
+    block = ''
+    for name, value in props:
+      block += 'K %d\n%s\nV %d\n%s\n' % (encoded_len(name), name,
+                                          encoded_len(value), value)
+    return block + 'PROPS-END\n'
+
+  date = time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime())
+  revprops = props_block([('svn:log', 'Log message for revision 1.'),
+                          ('svn:author', main.wc_author),
+                          ('svn:date', date)])
+  no_props = props_block([])
+
+  dump = ['SVN-fs-dump-format-version: 2\n\n',
+          'Revision-number: 1\n'
+          'Prop-content-length: %d\n'
+          'Content-length: %d\n\n' % (encoded_len(revprops),
+                                       encoded_len(revprops)),
+          revprops, '\n']
+
+  # Sorting puts every directory before its children.
+  for path in sorted(main.greek_state.desc):
+    contents = main.greek_state.desc[path].contents
+    dump.append('Node-path: %s\n' % path)
+    if contents is None:
+      dump.append('Node-kind: dir\n'
+                  'Node-action: add\n'
+                  'Prop-content-length: %d\n'
+                  'Content-length: %d\n\n' % (encoded_len(no_props),
+                                               encoded_len(no_props)))
+      dump.append(no_props)
+    else:
+      dump.append('Node-kind: file\n'
+                  'Node-action: add\n'
+                  'Prop-content-length: %d\n'
+                  'Text-content-length: %d\n'
+                  'Text-content-md5: %s\n'
+                  'Content-length: %d\n\n'
+                  % (encoded_len(no_props), encoded_len(contents),
+                     hashlib.md5(contents.encode('utf-8')).hexdigest(),
+                     encoded_len(no_props) + encoded_len(contents)))
+      dump.append(no_props)
+      dump.append(contents)
+    dump.append('\n\n')
+
+  return ''.join(dump).encode('utf-8').splitlines(True)
+
 def setup_pristine_greek_repository():
-  """Create the pristine repository and 'svn import' the greek tree"""
+  """Create the pristine repository and load the greek tree into it"""
 
   # these directories don't exist out of the box, so we may have to create them
   if not os.path.exists(main.general_wc_dir):
@@ -81,44 +140,17 @@ def setup_pristine_greek_repository():
     else:
       main.create_repos(main.pristine_greek_repos_dir)
 
-      # if this is dav, gives us access rights to import the greek tree.
+      # if this is dav, gives us access rights to the greek tree.
       if main.is_ra_type_dav():
         authz_file = os.path.join(main.work_dir, "authz")
         main.file_write(authz_file, "[/]\n* = rw\n")
 
-      # dump the greek tree to disk.
-      main.greek_state.write_to_disk(main.greek_dump_dir)
-
-      # import the greek tree, using l:foo/p:bar
-      ### todo: svn should not be prompting for auth info when using
-      ### repositories with no auth/auth requirements
-      _, output, _ = main.run_svn(None, 'import', '-m',
-                                  'Log message for revision 1.',
-                                  main.greek_dump_dir,
-                                  main.pristine_greek_repos_url)
-
-      # verify the printed output of 'svn import'.
-      lastline = output.pop().strip()
-      match = re.search("(Committed|Imported) revision [0-9]+.", lastline)
-      if not match:
-        logger.error("import did not succeed, while creating greek repos.")
-        logger.error("The final line from 'svn import' was:")
-        logger.error(lastline)
-        sys.exit(1)
-      output_tree = wc.State.from_commit(output)
-
-      expected_output_tree = main.greek_state.copy(main.greek_dump_dir)
-      expected_output_tree.tweak(verb='Adding',
-                                 contents=None)
-
-      try:
-        expected_output_tree.compare_and_display('output', output_tree)
-      except tree.SVNTreeUnequal:
-        verify.display_trees("ERROR:  output of import command is unexpected.",
-                             "OUTPUT TREE",
-                             expected_output_tree.old_tree(),
-                             output_tree.old_tree())
-        sys.exit(1)
+      # load the greek tree straight into the repository, rather than
+      # writing it to disk and importing it from there.  Run the
+      # post-commit hook like a commit would: with --fsfs-packing it
+      # is what packs the repository.
+      run_and_verify_load(main.pristine_greek_repos_dir, _greek_tree_dump(),
+                          use_post_commit_hook=True)
 
     # Finally, disallow any changes to the "pristine" repos.
     error_msg = "Don't modify the pristine repository"
@@ -134,13 +166,27 @@ def guarantee_empty_repository(path, minor_version):
   nothing."""
 
   if path == main.pristine_greek_repos_dir:
-    logger.error("attempt to overwrite the pristine repos!  Aborting.")
-    sys.exit(1)
+    raise main.SVNTestSetupError("attempt to overwrite the pristine repos!")
 
   # create an empty repository at PATH.
   main.safe_rmtree(path)
   main.create_repos(path, minor_version)
 
+def _can_clone_pristine_repos(minor_version):
+  """Return True if a copy of the pristine repository with the format
+  implied by MINOR_VERSION can be made by cloning its files."""
+
+  # BDB environments must not be copied file by file, and the packing
+  # post-commit hook refers to the absolute path of its repository.
+  if not (main.is_fs_type_fsfs() or main.is_fs_type_fsx()):
+    return False
+  if main.options.fsfs_packing:
+    return False
+
+  # The pristine repository has the newest format the server supports.
+  return (minor_version is None
+          or minor_version >= main.options.server_minor_version)
+
 # Used by every test, so that they can run independently of  one
 # another. Every time this routine is called, it recursively copies
 # the `pristine repos' to a new location.
@@ -151,25 +197,28 @@ def guarantee_greek_repository(path, minor_version):
   nothing but the greek-tree at revision 1."""
 
   if path == main.pristine_greek_repos_dir:
-    logger.error("attempt to overwrite the pristine repos!  Aborting.")
-    sys.exit(1)
+    raise main.SVNTestSetupError("attempt to overwrite the pristine repos!")
 
   # copy the pristine repository to PATH.
   main.safe_rmtree(path)
+  has_new_uuid = False
   if (main.options.fsfs_version is not None):
     failed = main.unpack_greek_repos(path)
+  elif _can_clone_pristine_repos(minor_version):
+    failed = main.clone_repos(main.pristine_greek_repos_dir, path)
+    has_new_uuid = True
   else:
     failed = main.copy_repos(main.pristine_greek_repos_dir,
                              path, 1, 1, minor_version)
   if failed:
-    logger.error("copying repository failed.")
-    sys.exit(1)
+    raise main.SVNTestSetupError("copying repository failed")
 
   # make the repos world-writeable, for mod_dav_svn's sake.
   main.chmod_tree(path, main.S_ALL_RW, main.S_ALL_RW)
 
-  # give the repository a unique UUID
-  run_and_verify_svnadmin([], [], 'setuuid', path)
+  # give the repository a unique UUID, unless clone_repos() already did
+  if not has_new_uuid:
+    run_and_verify_svnadmin([], [], 'setuuid', path)
 
 def run_and_verify_atomic_ra_revprop_change(expected_stdout,
                                             expected_stderr,
@@ -355,7 +404,8 @@ def run_and_verify_svn2(expected_stdout, expected_stderr,
   return exit_code, out, err
 
 def run_and_verify_load(repo_dir, dump_file_content,
-                        bypass_prop_validation = False):
+                        bypass_prop_validation = False,
+                        use_post_commit_hook = False):
   "Runs 'svnadmin load' and reports any errors."
   if not isinstance(dump_file_content, list):
     raise TypeError("dump_file_content argument should have list type")
@@ -363,6 +413,8 @@ def run_and_verify_load(repo_dir, dump_file_content,
   args = ()
   if bypass_prop_validation:
     args += ('--bypass-prop-validation',)
+  if use_post_commit_hook:
+    args += ('--use-post-commit-hook',)
   main.run_command_stdin(
     main.svnadmin_binary, expected_stderr, 0, True, dump_file_content,
     'load', '--force-uuid', '--quiet', repo_dir, *args)
@@ -1470,8 +1522,7 @@ def process_output_for_commit(output, error_re_string):
       rest.append(lastline)
       lastline = output.pop().strip()
 
-    cm = re.compile("(Committed|Imported) revision [0-9]+.")
-    match = cm.search(lastline)
+    match = _committed_re.search(lastline)
     if not match and not error_re_string:
       logger.warn("ERROR:  commit did not succeed.")
       logger.warn("The final line from 'svn ci' was:")
@@ -1486,8 +1537,7 @@ def process_output_for_commit(output, error_re_string):
   if len(output):
     lastline = output.pop()
 
-    tm = re.compile("Transmitting file data.+")
-    match = tm.search(lastline)
+    match = _transmitting_re.search(lastline)
     if not match:
       # whoops, it was important output, put it back.
       output.append(lastline)
@@ -1931,6 +1981,27 @@ def run_and_verify_revert(expected_paths, *args):
 # Other general utilities
 
 
+def _expected_checkout_output(state, wc_dir):
+  "Return the expected output State for checking out STATE into WC_DIR."
+  return wc.State(wc_dir, dict([(path, wc.StateItem(status='A '))
+                                for path in state.desc]))
+
+# What checking out the greek tree is expected to put on disk.
+# run_and_verify_checkout() only reads it, so it is built on first use
+# and then shared by all the sandboxes.
+_greek_disk_tree = None
+
+def _expected_checkout_disk(state):
+  """Return the expected disk tree for checking out STATE.  The tree may
+  be shared with other callers: don't modify it."""
+  global _greek_disk_tree
+
+  if state is not main.greek_state:
+    return state.old_tree()
+  if _greek_disk_tree is None:
+    _greek_disk_tree = state.old_tree()
+  return _greek_disk_tree
+
 # This allows a test to *quickly* bootstrap itself.
 def make_repo_and_wc(sbox, create_wc=True, read_only=False, empty=False,
                      minor_version=None):
@@ -1964,12 +2035,10 @@ def make_repo_and_wc(sbox, create_wc=True, read_only=False, empty=False,
 
   if create_wc:
     # Generate the expected output tree.
-    expected_output = expected_state.copy()
-    expected_output.wc_dir = sbox.wc_dir
-    expected_output.tweak(status='A ', contents=None)
+    expected_output = _expected_checkout_output(expected_state, sbox.wc_dir)
 
     # Generate an expected wc tree.
-    expected_wc = expected_state
+    expected_wc = _expected_checkout_disk(expected_state)
 
     # Do a checkout, and verify the resulting output and disk contents.
     run_and_verify_checkout(sbox.repo_url,
@@ -1987,10 +2056,13 @@ def make_repo_and_wc(sbox, create_wc=True, read_only=False, empty=False,
 # Duplicate a working copy or other dir.
 def duplicate_dir(wc_name, wc_copy_name):
   """Copy the working copy WC_NAME to WC_COPY_NAME.  Overwrite any
-  existing tree at that location."""
+  existing tree at that location.  Symlinks are copied as symlinks."""
 
+  # The copy must not share files with the original (no hardlinks):
+  # tests modify working files in place.  main.clone_tree() only shares
+  # data blocks copy-on-write, where the filesystem supports that.
   main.safe_rmtree(wc_copy_name)
-  shutil.copytree(wc_name, wc_copy_name)
+  main.clone_tree(wc_name, wc_copy_name)
 
 
 
@@ -1999,14 +2071,12 @@ def get_virginal_state(wc_dir, rev):
 
   rev = str(rev) ### maybe switch rev to an integer?
 
-  # copy the greek tree, shift it to the new wc_dir, insert a root elem,
-  # then tweak all values
-  state = main.greek_state.copy()
-  state.wc_dir = wc_dir
-  state.desc[''] = wc.StateItem()
-  state.tweak(contents=None, status='  ', wc_rev=rev)
-
-  return state
+  # take the paths of the greek tree plus a root elem, and create the
+  # items with their final values right away (rather than copying the
+  # greek tree's items and tweaking all of them)
+  paths = [''] + list(main.greek_state.desc)
+  return wc.State(wc_dir, dict([(path, wc.StateItem(status='  ', wc_rev=rev))
+                                for path in paths]))
 
 # Cheap administrative directory locking
 def lock_admin_dir(wc_dir, recursive=False, work_queue=False):
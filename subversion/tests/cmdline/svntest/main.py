@@ -111,6 +111,10 @@ class SVNRepositoryCreateFailure(Failure):
   "Exception raised if unable to create a repository"
   pass
 
+class SVNTestSetupError(Failure):
+  "Exception raised if the repositories a test needs can't be set up"
+  pass
+
 # Windows specifics
 if sys.platform == 'win32':
   windows = True
@@ -200,6 +204,11 @@ svnmover_binary = os.path.abspath('../../../tools/dev/svnmover/svnmover' + _exe)
 # when we know what the user specified for --url.
 pristine_greek_repos_url = None
 
+# URL of general_repo_dir, likewise calculated once from test_area_url so
+# that sandboxes can derive their repository URLs without requoting the
+# whole path.
+general_repo_url = None
+
 # Global variable to track all of our options
 options = None
 
@@ -208,6 +217,8 @@ options = None
 
 # All temporary repositories and working copies are created underneath
 # this dir, so there's one point at which to mount, e.g., a ramdisk.
+# Setting SVN_TEST_TMPFS to a directory on a ramdisk (e.g. /dev/shm)
+# turns this dir into a symlink to a directory below it.
 work_dir = "svn-test-work"
 
 # Constant for the merge info property.
@@ -231,7 +242,6 @@ temp_dir = os.path.join(work_dir, 'local_tmp')
 
 # (derivatives of the tmp dir.)
 pristine_greek_repos_dir = os.path.join(temp_dir, "repos")
-greek_dump_dir = os.path.join(temp_dir, "greekfiles")
 default_config_dir = os.path.abspath(os.path.join(temp_dir, "config"))
 
 #
@@ -385,16 +395,27 @@ def ensure_list(item):
     return list(item)
 
 def filter_dbg(lines, binary = False):
+  """Return the LINES that don't start with 'DBG:', as a list, and write
+  the ones that do to stdout.  LINES may be any iterable; it is walked
+  only once."""
   if binary:
-    excluded = filter(lambda line: line.startswith(b'DBG:'), lines)
-    excluded = map(bytes.decode, excluded)
-    included = filter(lambda line: not line.startswith(b'DBG:'), lines)
+    dbg_prefix = b'DBG:'
   else:
-    excluded = filter(lambda line: line.startswith('DBG:'), lines)
-    included = filter(lambda line: not line.startswith('DBG:'), lines)
+    dbg_prefix = 'DBG:'
 
-  sys.stdout.write(''.join(excluded))
-  return ensure_list(included)
+  included = []
+  excluded = []
+  for line in lines:
+    if line.startswith(dbg_prefix):
+      excluded.append(line)
+    else:
+      included.append(line)
+
+  if excluded:
+    if binary:
+      excluded = map(bytes.decode, excluded)
+    sys.stdout.write(''.join(excluded))
+  return included
 
 # Run any binary, logging the command line and return code
 def run_command(command, error_expected, binary_mode=False, *varargs):
@@ -418,6 +439,11 @@ _repos_diskpath2 = os.path.join('cmdline', 'svn-test-work', 'local_tmp',
 _repos_diskpath1_bytes = _repos_diskpath1.encode()
 _repos_diskpath2_bytes = _repos_diskpath2.encode()
 
+# The same paths below the directory svn-test-work resolves to, if
+# SVN_TEST_TMPFS made it a symlink.  See _add_resolved_repos_diskpaths().
+_resolved_repos_diskpaths = []
+_resolved_repos_diskpaths_bytes = []
+
 # A regular expression that matches arguments that are trivially safe
 # to pass on a command line without quoting on any supported operating
 # system:
@@ -583,14 +609,14 @@ def run_command_stdin(command, error_expected, bufsize=-1, binary_mode=False,
                                                         *varargs)
 
   def _line_contains_repos_diskpath(line):
-    # ### Note: this assumes that either svn-test-work isn't a symlink,
-    # ### or the diskpath isn't realpath()'d somewhere on the way from
-    # ### the server's configuration and the client's stderr.  We could
-    # ### check for both the symlinked path and the realpath.
+    # If svn-test-work is a symlink (see SVN_TEST_TMPFS), the server may
+    # report the realpath() of the diskpath, so check for both.
     if isinstance(line, str):
-      return _repos_diskpath1 in line or _repos_diskpath2 in line
+      return (_repos_diskpath1 in line or _repos_diskpath2 in line
+              or any(p in line for p in _resolved_repos_diskpaths))
     else:
-      return _repos_diskpath1_bytes in line or _repos_diskpath2_bytes in line
+      return (_repos_diskpath1_bytes in line or _repos_diskpath2_bytes in line
+              or any(p in line for p in _resolved_repos_diskpaths_bytes))
 
   for lines, name in [[stdout_lines, "stdout"], [stderr_lines, "stderr"]]:
     if is_ra_type_file() or 'svnadmin' in command or 'svnlook' in command:
@@ -972,6 +998,44 @@ def safe_rmtree(dirname, retry=0):
   else:
     rmtree(dirname)
 
+# For moving all scratch data onto a ramdisk
+def _setup_tmpfs_work_dir(tmpfs_dir):
+  """Make WORK_DIR a symlink to a directory below TMPFS_DIR, creating
+  that directory if needed.  All paths and URLs the tests compute stay
+  the same.  An empty WORK_DIR directory is replaced; a non-empty one is
+  left alone."""
+
+  abs_work_dir = os.path.abspath(work_dir)
+  target = os.path.join(os.path.abspath(tmpfs_dir), 'svn-test-work-%s'
+                        % hashlib.md5(abs_work_dir.encode()).hexdigest()[:8])
+
+  if os.path.islink(work_dir) and os.readlink(work_dir) != target:
+    os.unlink(work_dir)
+  elif os.path.exists(work_dir) and not os.path.islink(work_dir):
+    # An empty one is e.g. left behind by 'make check-clean'.
+    if not os.path.isdir(work_dir) or os.listdir(work_dir):
+      logger.warn("SVN_TEST_TMPFS ignored: '%s' is not an empty directory;"
+                  " remove it (e.g. 'rm -rf %s') to put the test data in %s"
+                  % (abs_work_dir, abs_work_dir, tmpfs_dir))
+      return
+    os.rmdir(work_dir)
+
+  if not os.path.isdir(target):
+    os.makedirs(target)
+  if not os.path.islink(work_dir):
+    os.symlink(target, work_dir)
+  _add_resolved_repos_diskpaths(os.path.realpath(target))
+
+def _add_resolved_repos_diskpaths(resolved_work_dir):
+  """Make run_command_stdin() also catch leaks of the repository paths
+  below RESOLVED_WORK_DIR, the directory WORK_DIR is a symlink to."""
+
+  for path in [os.path.join(resolved_work_dir, 'repositories'),
+               os.path.join(resolved_work_dir, 'local_tmp', 'repos')]:
+    if path not in _resolved_repos_diskpaths:
+      _resolved_repos_diskpaths.append(path)
+      _resolved_repos_diskpaths_bytes.append(path.encode())
+
 # For creating new files, and making local mods to existing files.
 def file_write(path, contents, mode='w'):
   """Write the CONTENTS to the file at PATH, opening file using MODE,
@@ -1231,6 +1295,66 @@ def copy_repos(src_path, dst_path, head_revision, ignore_uuid = 1,
     logger.warn('ERROR:  load failed; did not see revision %s', head_revision)
     raise SVNRepositoryCopyFailure
 
+# Whether clone_tree() can use 'cp --reflink=auto'.  Assumed until the
+# first attempt fails (e.g. with a BSD or busybox cp(1), which lack
+# --reflink); from then on clone_tree() goes straight to copytree().
+_cp_reflink_works = not windows
+
+# For copying a whole directory tree cheaply
+def clone_tree(src_path, dst_path):
+  """Copy the directory tree SRC_PATH to DST_PATH, which must not exist.
+  Where cp(1) supports it, let the filesystem share the data blocks
+  copy-on-write ('cp --reflink=auto' degrades to a plain copy on
+  filesystems without reflinks); otherwise fall back to shutil.copytree().
+  Symlinks are copied as symlinks."""
+  global _cp_reflink_works
+
+  if _cp_reflink_works:
+    # shutil.copytree() creates missing parents, cp(1) doesn't.
+    parent = os.path.dirname(dst_path)
+    if parent and not os.path.exists(parent):
+      os.makedirs(parent)
+
+    command = ['cp', '-a', '--reflink=auto', src_path, dst_path]
+    logger.info('CMD: %s' % ' '.join([_quote_arg(x) for x in command]))
+    try:
+      kid = subprocess.Popen(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+      kid.communicate()
+      if kid.returncode == 0:
+        return
+    except OSError:
+      pass
+    # Don't try cp(1) again, and don't leave a partial copy behind.
+    logger.info('cp --reflink=auto failed, using shutil.copytree()')
+    _cp_reflink_works = False
+    safe_rmtree(dst_path)
+
+  shutil.copytree(src_path, dst_path, symlinks=True)
+
+# For copying a repository without a dump/load cycle
+def clone_repos(src_path, dst_path):
+  """Copy the repository SRC_PATH to DST_PATH by cloning its files.
+  Only the hook templates are kept, so hooks installed in SRC_PATH
+  (e.g. the ones guarding the pristine repository) don't leak into the
+  copy.  Like copy_repos(), give the copy a fresh UUID.
+
+  This is only valid for FSFS and FSX repositories that no process is
+  writing to."""
+
+  clone_tree(src_path, dst_path)
+
+  hooks_dir = os.path.join(dst_path, 'hooks')
+  for name in os.listdir(hooks_dir):
+    if not name.endswith('.tmpl'):
+      os.remove(os.path.join(hooks_dir, name))
+
+  exit_code, stdout, stderr = run_command(svnadmin_binary, 1, False,
+                                          "setuuid", dst_path)
+  if exit_code or stderr:
+    logger.warn('ERROR:  setuuid failed: %s', ''.join(stderr).strip())
+    raise SVNRepositoryCopyFailure
+
 
 def canonicalize_url(input):
   "Canonicalize the url, if the scheme is unknown, returns intact input"
@@ -2285,6 +2409,7 @@ def execute_tests(test_list, serial_only = False, test_name = None,
 
   global pristine_url
   global pristine_greek_repos_url
+  global general_repo_url
   global svn_binary
   global svnadmin_binary
   global svnlook_binary
@@ -2362,6 +2487,9 @@ def execute_tests(test_list, serial_only = False, test_name = None,
                                 svntest.wc.svn_uri_quote(
                                   pristine_greek_repos_dir.replace(
                                       os.path.sep, '/'))
+  general_repo_url = options.test_area_url + '/' + \
+                       svntest.wc.svn_uri_quote(
+                         general_repo_dir.replace(os.path.sep, '/'))
 
   if options.use_jsvn:
     if options.svn_bin is None:
@@ -2395,6 +2523,15 @@ def execute_tests(test_list, serial_only = False, test_name = None,
 
   ######################################################################
 
+  # Put all scratch data on a ramdisk, if asked to.
+  tmpfs_dir = os.environ.get('SVN_TEST_TMPFS')
+  if tmpfs_dir and not windows:
+    if not options.is_child_process:
+      _setup_tmpfs_work_dir(tmpfs_dir)
+    elif os.path.islink(work_dir):
+      # The parent process made the symlink already.
+      _add_resolved_repos_diskpaths(os.path.realpath(work_dir))
+
   # Cleanup: if a previous run crashed or interrupted the python
   # interpreter, then `temp_dir' was never removed.  This can cause wonkiness.
   if not options.is_child_process:
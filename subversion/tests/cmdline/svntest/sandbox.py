@@ -112,9 +112,8 @@ class Sandbox:
     self.add_test_path(self.wc_dir)
     if empty or not read_only:  # use a local repo
       self.repo_dir = os.path.join(svntest.main.general_repo_dir, self.name)
-      self.repo_url = (svntest.main.options.test_area_url + '/'
-                       + svntest.wc.svn_uri_quote(
-                                self.repo_dir.replace(os.path.sep, '/')))
+      self.repo_url = (svntest.main.general_repo_url + '/'
+                       + svntest.wc.svn_uri_quote(self.name))
       self.add_test_path(self.repo_dir)
     else:
       self.repo_dir = svntest.main.pristine_greek_repos_dir
@@ -194,9 +193,8 @@ class Sandbox:
        Return (REPOS-PATH, REPOS-URL)."""
     path = (os.path.join(svntest.main.general_repo_dir, self.name)
             + '.' + suffix)
-    url = svntest.main.options.test_area_url + \
-                                        '/' + svntest.wc.svn_uri_quote(
-                                                path.replace(os.path.sep, '/'))
+    url = (svntest.main.general_repo_url + '/'
+           + svntest.wc.svn_uri_quote(self.name + '.' + suffix))
     self.add_test_path(path, remove)
     return path, url
 
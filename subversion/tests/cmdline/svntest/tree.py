@@ -681,23 +681,29 @@ def compare_trees(label,
         display_nodes(a, b)
         raise SVNTreeUnequal
 
-      accounted_for = []
+      accounted_for = set()
       # For each child of A, check and see if it's in B.  If so, run
       # compare_trees on the two children and add b's child to
       # accounted_for.  If not, run FUNC_A on the child.  Next, for each
       # child of B, check and see if it's in accounted_for.  If it is,
       # do nothing. If not, run FUNC_B on it.
+      # Look B's children up by name (the first one wins, as in
+      # get_child()) and track them by identity, so that comparing two
+      # directories is linear rather than quadratic in their size.
+      b_children = {}
+      for b_child in b.children:
+        b_children.setdefault(b_child.name, b_child)
       for a_child in a.children:
-        b_child = get_child(b, a_child.name)
-        if b_child:
-          accounted_for.append(b_child)
+        b_child = b_children.get(a_child.name)
+        if b_child is not None:
+          accounted_for.add(id(b_child))
           compare_trees(label, a_child, b_child,
                         singleton_handler_a, a_baton,
                         singleton_handler_b, b_baton)
         else:
           singleton_handler_a(a_child, a_baton)
       for b_child in b.children:
-        if b_child not in accounted_for:
+        if id(b_child) not in accounted_for:
           singleton_handler_b(b_child, b_baton)
   except SVNTypeMismatch:
     logger.warn('Unequal Types: one Node is a file, the other is a directory')
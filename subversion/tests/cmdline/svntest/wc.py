@@ -677,13 +677,18 @@ class State:
     desc = { }
     dot_svn = svntest.main.get_admin_name()
 
-    for dirpath, dirs, files in os.walk(base):
-      parent = path_to_key(dirpath, base)
-      if ignore_svn and dot_svn in dirs:
-        dirs.remove(dot_svn)
-      for name in dirs + files:
-        node = os.path.join(dirpath, name)
-        if os.path.isfile(node):
+    # Like os.walk(): follow symlinks to find out whether an entry is a
+    # directory or a file, but don't descend into symlinked directories,
+    # and skip directories that can't be read.
+    def walk(dirpath, parent):
+      try:
+        entries = _scan_dir(dirpath)
+      except OSError:
+        return
+      for name, node, is_dir, is_link, is_file in entries:
+        if is_dir and ignore_svn and name == dot_svn:
+          continue
+        if is_file:
           try:
             if keep_eol_style:
               contents = open(node, 'r', newline='').read()
@@ -693,7 +698,12 @@ class State:
             contents = open(node, 'rb').read()
         else:
           contents = None
-        desc[repos_join(parent, name)] = StateItem(contents=contents)
+        path = repos_join(parent, name)
+        desc[path] = StateItem(contents=contents)
+        if is_dir and not is_link:
+          walk(node, path)
+
+    walk(base, '')
 
     if load_props:
       paths = [os.path.join(base, to_ospath(p)) for p in desc.keys()]
@@ -1040,6 +1050,26 @@ else:
     return path.replace('/', os.sep)
 
 
+def _scan_dir(path):
+  """Return a list of (NAME, NODE, IS_DIR, IS_LINK, IS_FILE) tuples, one
+  for each entry NAME of the directory PATH, where NODE is the entry's
+  path.  IS_DIR and IS_FILE follow symlinks.  Where os.scandir() is
+  available, the entry types come from the directory listing itself and
+  only symlinks need an extra stat()."""
+  if hasattr(os, 'scandir'):
+    return [(entry.name, entry.path, entry.is_dir(), entry.is_symlink(),
+             entry.is_file())
+            for entry in os.scandir(path)]
+
+  # Python <3.5
+  entries = []
+  for name in os.listdir(path):
+    node = os.path.join(path, name)
+    entries.append((name, node, os.path.isdir(node), os.path.islink(node),
+                    os.path.isfile(node)))
+  return entries
+
+
 def path_to_key(path, base):
   """Return the relative path that represents the absolute path PATH under
   the absolute path BASE.  PATH must be a path under BASE.  The returned